@@ -334,14 +334,17 @@ def generate(output_dir: str, force: bool, force_reprocess: bool, limit: Optiona
 
         click.echo(f"Generating policy data in {output_dir}...")
 
-        with click.progressbar(length=100, label="Generating data") as bar:
-            # This is simplified - in reality would update progress
-            summary = await generator.generate_all_data(
-                force_download=force,
-                limit=limit,
-                force_reprocess=force_reprocess
-            )
-            bar.update(100)
+        try:
+            with click.progressbar(length=100, label="Generating data") as bar:
+                # This is simplified - in reality would update progress
+                summary = await generator.generate_all_data(
+                    force_download=force,
+                    limit=limit,
+                    force_reprocess=force_reprocess
+                )
+                bar.update(100)
+        finally:
+            await generator.llm_analyzer.aclose()
 
         click.secho(f"✓ Generated data for {summary['total_licenses']} licenses", fg="green")
         click.echo(f"Output directory: {summary['output_directory']}")
@@ -359,7 +362,13 @@ def generate(output_dir: str, force: bool, force_reprocess: bool, limit: Optiona
             click.secho(f"⚠ Validation issues found: {len(validation.get('validation_errors', []))}", fg="yellow")
 
     try:
-        asyncio.run(run_generation())
+        import uvloop  # Optional faster event loop, installed with the "fast" extra
+        run = uvloop.run
+    except ImportError:
+        run = asyncio.run
+
+    try:
+        run(run_generation())
     except Exception as e:
         click.secho(f"Error: {e}", fg="red", err=True)
         sys.exit(1)
@@ -7,15 +7,162 @@ import json
 import yaml
 import logging
 import asyncio
+import os
+from collections import Counter, namedtuple
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple
 from datetime import datetime
 
 from ospac.pipeline.spdx_processor import SPDXProcessor
 from ospac.pipeline.llm_analyzer import LicenseAnalyzer
+from ospac.utils.jsonio import json_dumps
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper
 
 logger = logging.getLogger(__name__)
 
+_LINKING_RULE_KEYS = ("compatible_with", "incompatible_with", "requires_review")
+
+# Buffer size for streamed aggregate files, to keep write syscalls few and large
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# License fields resolved once and shared by all database generators
+LicenseRow = namedtuple(
+    "LicenseRow",
+    "id name category permissions conditions limitations obligations "
+    "key_requirements compatibility_rules spdx_data"
+)
+
+# Possible outcomes of a category-level compatibility check (shared, read-only)
+_COMPAT_COMPATIBLE = {
+    "static_linking": "compatible",
+    "dynamic_linking": "compatible",
+    "distribution": "compatible"
+}
+_COMPAT_STRONG_MISMATCH = {
+    "static_linking": "incompatible",
+    "dynamic_linking": "review_required",
+    "distribution": "incompatible"
+}
+_COMPAT_WEAK = {
+    "static_linking": "review_required",
+    "dynamic_linking": "compatible",
+    "distribution": "compatible"
+}
+_COMPAT_UNKNOWN = {
+    "static_linking": "unknown",
+    "dynamic_linking": "unknown",
+    "distribution": "unknown"
+}
+
+
+@lru_cache(maxsize=None)
+def _compatibility_for_categories(cat1: str, cat2: str) -> Dict[str, str]:
+    """Resolve the compatibility of two license categories."""
+    # Permissive licenses are generally compatible
+    if cat1 == "permissive" and cat2 == "permissive":
+        return _COMPAT_COMPATIBLE
+
+    # Strong copyleft contamination
+    if cat1 == "copyleft_strong" or cat2 == "copyleft_strong":
+        return _COMPAT_COMPATIBLE if cat1 == cat2 else _COMPAT_STRONG_MISMATCH
+
+    # Weak copyleft
+    if cat1 == "copyleft_weak" or cat2 == "copyleft_weak":
+        return _COMPAT_WEAK
+
+    return _COMPAT_UNKNOWN
+
+
+def _write_bytes_atomic(path: Path, payload: bytes) -> None:
+    """
+    Write payload to path so readers never see a partially written file.
+
+    The data goes to a temporary sibling first and is then renamed over the
+    target. No fsync is done since generated files can always be regenerated.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, path)
+
+
+def _write_bytes_if_changed(path: Path, payload: bytes) -> bool:
+    """
+    Write payload to path unless the file already holds exactly these bytes.
+
+    The file on disk is the reference, so the skip stays correct no matter
+    which writer produced it.
+
+    Returns:
+        Whether the file was written
+    """
+    try:
+        if path.stat().st_size == len(payload) and path.read_bytes() == payload:
+            return False
+    except FileNotFoundError:
+        pass
+    _write_bytes_atomic(path, payload)
+    return True
+
+
+def _write_json(path: Path, data: Any) -> None:
+    """
+    Write data to path as indented JSON.
+
+    The document is serialized in memory first so each file is written with
+    a single call instead of the many small writes json.dump issues.
+    """
+    path.write_bytes(json_dumps(data, indent=True))
+
+
+def _format_compatibility_for_policy(rules: Dict[str, Any]) -> Dict[str, Any]:
+    """Format compatibility rules for policy file."""
+    static = rules.get("static_linking") or {}
+    dynamic = rules.get("dynamic_linking") or {}
+    return {
+        "static_linking": {key: static.get(key, []) for key in _LINKING_RULE_KEYS},
+        "dynamic_linking": {key: dynamic.get(key, []) for key in _LINKING_RULE_KEYS},
+        "contamination_effect": rules.get("contamination_effect", "none"),
+        "notes": rules.get("notes", "")
+    }
+
+
+def _write_policy_file(license_dir: Path, row: LicenseRow) -> bool:
+    """
+    Write the policy file for a single license unless its content is unchanged.
+
+    Returns:
+        Whether the file was written
+    """
+    # Create policy structure
+    policy = {
+        "license": {
+            "id": row.id,
+            "name": row.name,
+            "type": row.category,
+            "spdx_id": row.id,
+
+            "properties": row.permissions,
+            "requirements": row.conditions,
+            "limitations": row.limitations,
+
+            "compatibility": _format_compatibility_for_policy(row.compatibility_rules),
+
+            "obligations": row.obligations,
+            "key_requirements": row.key_requirements
+        }
+    }
+
+    payload = yaml.dump(policy, Dumper=SafeDumper, default_flow_style=False,
+                        sort_keys=False).encode("utf-8")
+
+    # Save as YAML
+    return _write_bytes_if_changed(license_dir / f"{row.id}.yaml", payload)
+
 
 class PolicyDataGenerator:
     """
@@ -44,18 +191,23 @@ class PolicyDataGenerator:
             **llm_kwargs
         )
 
-        # Ensure output directories exist
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        (self.output_dir / "licenses").mkdir(exist_ok=True)
-        (self.output_dir / "licenses" / "spdx").mkdir(exist_ok=True)
-        (self.output_dir / "compatibility").mkdir(exist_ok=True)
-        (self.output_dir / "compatibility" / "relationships").mkdir(exist_ok=True)
-        (self.output_dir / "obligations").mkdir(exist_ok=True)
+        # Ensure output directories exist; creating the leaves creates their parents
+        self._dirs_created: Set[Path] = set()
+        for leaf_dir in (("licenses", "spdx"), ("compatibility", "relationships"), ("obligations",)):
+            self._ensure_dir(self.output_dir.joinpath(*leaf_dir))
 
         # Progress tracking
         self.progress_file = self.output_dir / "generation_progress.json"
         self.processed_licenses = self._load_progress()
 
+    def _ensure_dir(self, path: Path) -> None:
+        """Create a directory and its parents, skipping ones already created."""
+        if path in self._dirs_created:
+            return
+        path.mkdir(parents=True, exist_ok=True)
+        self._dirs_created.add(path)
+        self._dirs_created.update(path.parents)
+
     def _load_progress(self) -> set:
         """Load previously processed licenses from progress file."""
         if self.progress_file.exists():
@@ -106,8 +258,8 @@ class PolicyDataGenerator:
         # Save to individual file
         license_file = self.output_dir / "licenses" / "spdx" / f"{license_id}.yaml"
         try:
-            with open(license_file, 'w') as f:
-                yaml.dump(policy_data, f, default_flow_style=False, sort_keys=False)
+            text = yaml.dump(policy_data, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+            _write_bytes_if_changed(license_file, text.encode("utf-8"))
         except Exception as e:
             logger.error(f"Failed to save policy file for {license_id}: {e}")
 
@@ -208,6 +360,8 @@ class PolicyDataGenerator:
             Summary of generated data
         """
         logger.info("Starting policy data generation")
+        # One timestamp for the whole run keeps the generated files consistent
+        self._run_started = datetime.now().isoformat()
 
         # Step 1: Download and process SPDX data
         logger.info("Downloading SPDX license data...")
@@ -231,6 +385,11 @@ class PolicyDataGenerator:
         processed_licenses = []
         analyzed_licenses = []
 
+        # Fetch all license texts up front so network round trips overlap
+        license_texts = self.spdx_processor.prefetch_license_texts(
+            [l.get("licenseId") for l in licenses_to_process if l.get("licenseId")]
+        )
+
         for i, license_data in enumerate(licenses_to_process, 1):
             license_id = license_data.get("licenseId")
             if not license_id:
@@ -240,7 +399,7 @@ class PolicyDataGenerator:
 
             try:
                 # Get license text
-                license_text = self.spdx_processor.get_license_text(license_id)
+                license_text = license_texts.get(license_id)
 
                 license_to_analyze = {
                     "id": license_id,
@@ -275,32 +434,32 @@ class PolicyDataGenerator:
         # Convert YAML format to expected format for compatibility functions
         converted_analyzed = self._convert_yaml_format(analyzed_licenses)
         converted_all = self._convert_yaml_format(all_analyzed)
+        rows = self._normalize_licenses(converted_all)
 
-        compatibility_matrix = self._generate_compatibility_matrix(converted_all)
-        obligation_database = self._generate_obligation_database(converted_all)
+        self._generate_compatibility_matrix(rows, self._run_started)
+        obligation_database = self._generate_obligation_database(rows, self._run_started)
 
         # Step 5: Generate modular per-license files and index
         logger.info("Generating modular per-license files...")
-        self._generate_modular_license_files(converted_all, compatibility_matrix, obligation_database)
+        self._generate_modular_license_files(rows, obligation_database, self._run_started)
 
         # Skip legacy master database generation - using modular files only
 
         # Step 6: Generate validation data
-        validation_report = self._validate_generated_data(analyzed_licenses)
+        categories, validation_report = self._scan_licenses(analyzed_licenses)
 
         summary = {
             "total_licenses": len(analyzed_licenses),
             "spdx_version": spdx_data.get("version"),
-            "generated_at": datetime.now().isoformat(),
+            "generated_at": self._run_started,
             "output_directory": str(self.output_dir),
-            "categories": self._count_categories(analyzed_licenses),
+            "categories": categories,
             "validation": validation_report
         }
 
         # Save summary
         summary_file = self.output_dir / "generation_summary.json"
-        with open(summary_file, "w") as f:
-            json.dump(summary, f, indent=2)
+        _write_json(summary_file, summary)
 
         # Step 7: Clean up temporary/intermediate files for packaging
         logger.info("Cleaning up temporary files for final package...")
@@ -309,98 +468,89 @@ class PolicyDataGenerator:
         logger.info(f"Data generation complete. Summary saved to {summary_file}")
         return summary
 
-    def _generate_license_policies(self, licenses: List[Dict[str, Any]]) -> None:
-        """Generate individual license policy files."""
-        license_dir = self.output_dir / "licenses" / "spdx"
-        license_dir.mkdir(parents=True, exist_ok=True)
-
+    def _normalize_licenses(self, licenses: List[Dict[str, Any]]) -> List[LicenseRow]:
+        """Resolve the fields of each license dict once, skipping licenses without an ID."""
+        rows = []
         for license_data in licenses:
             license_id = license_data.get("license_id")
             if not license_id:
                 continue
 
-            # Create policy structure
-            policy = {
-                "license": {
-                    "id": license_id,
-                    "name": license_data.get("name", license_id),
-                    "type": license_data.get("category", "permissive"),
-                    "spdx_id": license_id,
-
-                    "properties": license_data.get("permissions", {}),
-                    "requirements": license_data.get("conditions", {}),
-                    "limitations": license_data.get("limitations", {}),
+            rows.append(LicenseRow(
+                id=license_id,
+                name=license_data.get("name", license_id),
+                category=license_data.get("category", "permissive"),
+                permissions=license_data.get("permissions", {}),
+                conditions=license_data.get("conditions", {}),
+                limitations=license_data.get("limitations", {}),
+                obligations=license_data.get("obligations", []),
+                key_requirements=license_data.get("key_requirements", []),
+                compatibility_rules=license_data.get("compatibility_rules", {}),
+                spdx_data=license_data.get("spdx_data", {})
+            ))
+        return rows
+
+    def _generate_license_policies(self, licenses: List[LicenseRow]) -> None:
+        """
+        Generate individual license policy files.
 
-                    "compatibility": self._format_compatibility_for_policy(
-                        license_data.get("compatibility_rules", {})
-                    ),
+        Policies whose serialized YAML matches the file already on disk are
+        not rewritten.
+        """
+        license_dir = self.output_dir / "licenses" / "spdx"
+        self._ensure_dir(license_dir)
 
-                    "obligations": license_data.get("obligations", []),
-                    "key_requirements": license_data.get("key_requirements", [])
-                }
-            }
+        written = sum(_write_policy_file(license_dir, row) for row in licenses)
+        logger.info(f"Generated {len(licenses)} license policy files ({written} changed)")
 
-            # Save as YAML
-            policy_file = license_dir / f"{license_id}.yaml"
-            with open(policy_file, "w") as f:
-                yaml.dump(policy, f, default_flow_style=False, sort_keys=False)
+    def _generate_compatibility_matrix(self, licenses: List[LicenseRow],
+                                       timestamp: str) -> Dict[str, Any]:
+        """
+        Generate license compatibility matrix using split architecture.
 
-        logger.info(f"Generated {len(licenses)} license policy files")
+        The full matrix is streamed to disk one row at a time so memory stays
+        proportional to the number of licenses rather than its square.
 
-    def _format_compatibility_for_policy(self, rules: Dict[str, Any]) -> Dict[str, Any]:
-        """Format compatibility rules for policy file."""
-        return {
-            "static_linking": {
-                "compatible_with": rules.get("static_linking", {}).get("compatible_with", []),
-                "incompatible_with": rules.get("static_linking", {}).get("incompatible_with", []),
-                "requires_review": rules.get("static_linking", {}).get("requires_review", [])
-            },
-            "dynamic_linking": {
-                "compatible_with": rules.get("dynamic_linking", {}).get("compatible_with", []),
-                "incompatible_with": rules.get("dynamic_linking", {}).get("incompatible_with", []),
-                "requires_review": rules.get("dynamic_linking", {}).get("requires_review", [])
-            },
-            "contamination_effect": rules.get("contamination_effect", "none"),
-            "notes": rules.get("notes", "")
-        }
-
-    def _generate_compatibility_matrix(self, licenses: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Generate license compatibility matrix using split architecture."""
+        Returns:
+            License count and path of the full matrix file
+        """
         from ospac.core.compatibility_matrix import CompatibilityMatrix
 
         # Initialize the matrix handler
         matrix_handler = CompatibilityMatrix(str(self.output_dir / "compatibility"))
 
-        # Build full matrix for conversion
-        full_matrix = {
+        header = {
             "version": "1.0",
-            "generated": datetime.now().isoformat(),
-            "total_licenses": len(licenses),
-            "compatibility": {}
+            "generated": timestamp,
+            "total_licenses": len(licenses)
         }
 
-        # Build compatibility matrix
-        for license1 in licenses:
-            id1 = license1.get("license_id")
-            if not id1:
-                continue
-
-            full_matrix["compatibility"][id1] = {}
-
-            for license2 in licenses:
-                id2 = license2.get("license_id")
-                if not id2:
-                    continue
+        # Compatibility only depends on the category pair, so evaluate each
+        # distinct pair once and share the result across all matching cells
+        entries = [(row.id, row.category) for row in licenses]
+        categories = {category for _, category in entries}
+        pair_table = {
+            (cat1, cat2): _compatibility_for_categories(cat1, cat2)
+            for cat1 in categories
+            for cat2 in categories
+        }
 
-                # Determine compatibility
-                compat = self._check_license_compatibility(license1, license2)
-                full_matrix["compatibility"][id1][id2] = compat
+        # Rows of licenses sharing a category are identical, so serialize each once
+        row_json = {
+            cat1: json_dumps({id2: pair_table[(cat1, cat2)] for id2, cat2 in entries})
+            for cat1 in categories
+        }
 
         # Save both formats: full matrix for backward compatibility and split for efficiency
         # Save full matrix (can be removed later if space is an issue)
         matrix_file = self.output_dir / "compatibility_matrix.json"
-        with open(matrix_file, "w") as f:
-            json.dump(full_matrix, f, indent=2)
+        with open(matrix_file, "wb", buffering=_WRITE_BUFFER_SIZE) as f:
+            f.write(json_dumps(header)[:-1] + b', "compatibility": {')
+            for i, (id1, cat1) in enumerate(entries):
+                if i:
+                    f.write(b", ")
+                f.write(json_dumps(id1) + b": " + row_json[cat1])
+            f.write(b"}}\n")
 
         # Convert to efficient split format
         matrix_handler.build_from_full_matrix(str(matrix_file))
@@ -409,137 +559,108 @@ class PolicyDataGenerator:
         logger.info(f"  Full matrix: {matrix_file}")
         logger.info(f"  Split format: {self.output_dir / 'compatibility'}")
 
-        return full_matrix
+        return {"total_licenses": len(licenses), "path": str(matrix_file)}
 
     def _check_license_compatibility(self, license1: Dict, license2: Dict) -> Dict[str, Any]:
-        """Check compatibility between two licenses."""
-        cat1 = license1.get("category", "permissive")
-        cat2 = license2.get("category", "permissive")
-
-        # Basic compatibility rules
-        compatibility = {
-            "static_linking": "unknown",
-            "dynamic_linking": "unknown",
-            "distribution": "unknown"
-        }
-
-        # Permissive licenses are generally compatible
-        if cat1 == "permissive" and cat2 == "permissive":
-            compatibility = {
-                "static_linking": "compatible",
-                "dynamic_linking": "compatible",
-                "distribution": "compatible"
-            }
-
-        # Strong copyleft contamination
-        elif cat1 == "copyleft_strong" or cat2 == "copyleft_strong":
-            if cat1 == cat2:
-                compatibility = {
-                    "static_linking": "compatible",
-                    "dynamic_linking": "compatible",
-                    "distribution": "compatible"
-                }
-            else:
-                compatibility = {
-                    "static_linking": "incompatible",
-                    "dynamic_linking": "review_required",
-                    "distribution": "incompatible"
-                }
-
-        # Weak copyleft
-        elif cat1 == "copyleft_weak" or cat2 == "copyleft_weak":
-            compatibility = {
-                "static_linking": "review_required",
-                "dynamic_linking": "compatible",
-                "distribution": "compatible"
-            }
+        """
+        Check compatibility between two licenses.
 
-        return compatibility
+        The returned dict is shared between calls and must not be modified.
+        """
+        return _compatibility_for_categories(
+            license1.get("category", "permissive"),
+            license2.get("category", "permissive")
+        )
 
-    def _generate_obligation_database(self, licenses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _generate_obligation_database(self, licenses: List[LicenseRow],
+                                      timestamp: str) -> Dict[str, Any]:
         """Generate obligation database."""
         obligations = {
             "version": "1.0",
-            "generated": datetime.now().isoformat(),
+            "generated": timestamp,
             "licenses": {}
         }
 
-        for license_data in licenses:
-            license_id = license_data.get("license_id")
-            if not license_id:
-                continue
-
-            obligations["licenses"][license_id] = {
-                "obligations": license_data.get("obligations", []),
-                "key_requirements": license_data.get("key_requirements", []),
-                "conditions": license_data.get("conditions", {}),
-                "attribution_required": license_data.get("conditions", {}).get("include_copyright", False),
-                "source_disclosure_required": license_data.get("conditions", {}).get("disclose_source", False),
-                "notice_required": license_data.get("conditions", {}).get("include_notice", False)
+        for row in licenses:
+            obligations["licenses"][row.id] = {
+                "obligations": row.obligations,
+                "key_requirements": row.key_requirements,
+                "conditions": row.conditions,
+                "attribution_required": row.conditions.get("include_copyright", False),
+                "source_disclosure_required": row.conditions.get("disclose_source", False),
+                "notice_required": row.conditions.get("include_notice", False)
             }
 
         # Save obligations
         obligations_file = self.output_dir / "obligation_database.json"
-        with open(obligations_file, "w") as f:
-            json.dump(obligations, f, indent=2)
+        _write_json(obligations_file, obligations)
 
         logger.info(f"Generated obligation database: {obligations_file}")
         return obligations
 
-    def _generate_master_database(self, licenses: List[Dict[str, Any]],
-                                 compatibility_matrix: Dict[str, Any],
-                                 obligation_database: Dict[str, Any]) -> None:
-        """Generate master database with all license information."""
+    def _generate_master_database(self, licenses: List[LicenseRow],
+                                 obligation_database: Dict[str, Any],
+                                 timestamp: str, write_yaml_mirror: bool = False) -> None:
+        """
+        Generate master database with all license information.
+
+        The JSON file is authoritative; a YAML copy for readability is only
+        written when write_yaml_mirror is set, as it is by far the slowest
+        file to serialize.
+        """
         master_db = {
             "version": "1.0",
-            "generated": datetime.now().isoformat(),
+            "generated": timestamp,
             "total_licenses": len(licenses),
             "licenses": {}
         }
 
-        for license_data in licenses:
-            license_id = license_data.get("license_id")
-            if not license_id:
-                continue
-
-            master_db["licenses"][license_id] = {
-                "id": license_id,
-                "name": license_data.get("name", license_id),
-                "category": license_data.get("category"),
-                "permissions": license_data.get("permissions"),
-                "conditions": license_data.get("conditions"),
-                "limitations": license_data.get("limitations"),
-                "obligations": obligation_database["licenses"].get(license_id, {}).get("obligations", []),
-                "compatibility_rules": license_data.get("compatibility_rules", {}),
+        for row in licenses:
+            master_db["licenses"][row.id] = {
+                "id": row.id,
+                "name": row.name,
+                "category": row.category,
+                "permissions": row.permissions,
+                "conditions": row.conditions,
+                "limitations": row.limitations,
+                "obligations": obligation_database["licenses"].get(row.id, {}).get("obligations", []),
+                "compatibility_rules": row.compatibility_rules,
                 "spdx_metadata": {
-                    "is_osi_approved": license_data.get("spdx_data", {}).get("isOsiApproved", False),
-                    "is_fsf_libre": license_data.get("spdx_data", {}).get("isFsfLibre", False),
-                    "is_deprecated": license_data.get("spdx_data", {}).get("isDeprecatedLicenseId", False)
+                    "is_osi_approved": row.spdx_data.get("isOsiApproved", False),
+                    "is_fsf_libre": row.spdx_data.get("isFsfLibre", False),
+                    "is_deprecated": row.spdx_data.get("isDeprecatedLicenseId", False)
                 }
             }
 
         # Save master database
         master_file = self.output_dir / "ospac_license_database.json"
-        with open(master_file, "w") as f:
-            json.dump(master_db, f, indent=2)
+        _write_json(master_file, master_db)
 
         logger.info(f"Generated master database: {master_file}")
 
-        # Also save as YAML for readability
-        master_yaml = self.output_dir / "ospac_license_database.yaml"
-        with open(master_yaml, "w") as f:
-            yaml.dump(master_db, f, default_flow_style=False)
+        if write_yaml_mirror:
+            # Also save as YAML for readability
+            master_yaml = self.output_dir / "ospac_license_database.yaml"
+            with open(master_yaml, "wb", buffering=_WRITE_BUFFER_SIZE) as f:
+                yaml.dump(master_db, f, Dumper=SafeDumper, default_flow_style=False, encoding="utf-8")
 
     def _count_categories(self, licenses: List[Dict[str, Any]]) -> Dict[str, int]:
         """Count licenses by category."""
-        categories = {}
-        for license_data in licenses:
-            cat = license_data.get("category", "unknown")
-            categories[cat] = categories.get(cat, 0) + 1
-        return categories
+        return dict(Counter(license_data.get("category", "unknown") for license_data in licenses))
 
     def _validate_generated_data(self, licenses: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Validate the generated data for completeness and consistency."""
+        return self._scan_licenses(licenses)[1]
+
+    def _scan_licenses(self, licenses: List[Dict[str, Any]]) -> Tuple[Dict[str, int], Dict[str, Any]]:
+        """
+        Count categories and validate licenses in a single pass.
+
+        Returns:
+            Category counts (as _count_categories) and validation report
+            (as _validate_generated_data)
+        """
+        categories = Counter()
         report = {
             "total_licenses": len(licenses),
             "missing_category": 0,
@@ -551,6 +672,7 @@ class PolicyDataGenerator:
 
         for license_data in licenses:
             license_id = license_data.get("license_id", "unknown")
+            categories[license_data.get("category", "unknown")] += 1
 
             if not license_data.get("category"):
                 report["missing_category"] += 1
@@ -568,7 +690,7 @@ class PolicyDataGenerator:
 
         report["is_valid"] = len(report["validation_errors"]) == 0
 
-        return report
+        return dict(categories), report
 
     def _cleanup_temporary_files(self) -> None:
         """Clean up temporary/intermediate files to prepare data for packaging."""
@@ -609,6 +731,8 @@ class PolicyDataGenerator:
             if dir_path.exists():
                 shutil.rmtree(dir_path)
                 logger.info(f"Removed directory: {dirname}")
+            self._dirs_created = {d for d in self._dirs_created
+                                 if d != dir_path and dir_path not in d.parents}
 
         # Keep only essential files:
         # - licenses/ directory (modular per-license files with obligations)
@@ -616,25 +740,24 @@ class PolicyDataGenerator:
 
         logger.info("Cleanup complete. Package-ready data contains only modular license files.")
 
-    def _generate_modular_license_files(self, licenses: List[Dict[str, Any]],
-                                      compatibility_matrix: Dict[str, Any],
-                                      obligation_database: Dict[str, Any]) -> None:
+    def _generate_modular_license_files(self, licenses: List[LicenseRow],
+                                      obligation_database: Dict[str, Any],
+                                      timestamp: str) -> None:
         """Generate individual license files with obligations and compatibility data."""
         licenses_dir = self.output_dir / "licenses"
-        licenses_dir.mkdir(parents=True, exist_ok=True)
+        self._ensure_dir(licenses_dir)
 
         # Create index for license discovery
         index = {
             "version": "1.0",
-            "generated": datetime.now().isoformat(),
+            "generated": timestamp,
             "total_licenses": len(licenses),
             "licenses": {}
         }
 
-        for license_data in licenses:
-            license_id = license_data.get("license_id")
-            if not license_id:
-                continue
+        for row in licenses:
+            license_id = row.id
+            license_obligations = obligation_database["licenses"].get(license_id, {})
 
             # Note: Compatibility will be calculated on-demand by comparing obligations
             # No need to store massive pre-computed compatibility matrices
@@ -642,38 +765,36 @@ class PolicyDataGenerator:
             # Create per-license file
             license_file_data = {
                 "id": license_id,
-                "name": license_data.get("name", license_id),
-                "category": license_data.get("category"),
-                "obligations": obligation_database["licenses"].get(license_id, {}).get("obligations", []),
-                "key_requirements": obligation_database["licenses"].get(license_id, {}).get("key_requirements", []),
-                "permissions": license_data.get("permissions", {}),
-                "conditions": license_data.get("conditions", {}),
-                "limitations": license_data.get("limitations", {}),
+                "name": row.name,
+                "category": row.category,
+                "obligations": license_obligations.get("obligations", []),
+                "key_requirements": license_obligations.get("key_requirements", []),
+                "permissions": row.permissions,
+                "conditions": row.conditions,
+                "limitations": row.limitations,
                 # Compatibility calculated on-demand by comparing obligations
                 "spdx_metadata": {
-                    "is_osi_approved": license_data.get("spdx_data", {}).get("isOsiApproved", False),
-                    "is_fsf_libre": license_data.get("spdx_data", {}).get("isFsfLibre", False),
-                    "is_deprecated": license_data.get("spdx_data", {}).get("isDeprecatedLicenseId", False)
+                    "is_osi_approved": row.spdx_data.get("isOsiApproved", False),
+                    "is_fsf_libre": row.spdx_data.get("isFsfLibre", False),
+                    "is_deprecated": row.spdx_data.get("isDeprecatedLicenseId", False)
                 },
-                "generated": datetime.now().isoformat()
+                "generated": timestamp
             }
 
             # Save individual license file
             license_file = licenses_dir / f"{license_id}.json"
-            with open(license_file, "w") as f:
-                json.dump(license_file_data, f, indent=2)
+            _write_json(license_file, license_file_data)
 
             # Add to index
             index["licenses"][license_id] = {
-                "name": license_data.get("name", license_id),
-                "category": license_data.get("category"),
+                "name": row.name,
+                "category": row.category,
                 "file": f"licenses/{license_id}.json",
                 "obligations_count": len(license_file_data["obligations"])
             }
 
         # Save index file
         index_file = self.output_dir / "index.json"
-        with open(index_file, "w") as f:
-            json.dump(index, f, indent=2)
+        _write_json(index_file, index)
 
         logger.info(f"Generated {len(licenses)} modular license files and index")
\ No newline at end of file
@@ -4,27 +4,176 @@ Supports OpenAI, Anthropic Claude, and local Ollama.
 Analyzes licenses to extract obligations, compatibility rules, and classifications.
 """
 
+import copy
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional
+from pathlib import Path
+from types import MappingProxyType
+from typing import AsyncIterator, Dict, List, Any, Mapping, Optional
 import asyncio
 import os
+import random
 
 from ospac.pipeline.llm_providers import (
+    _fallback_analysis,
+    _fallback_category,
     LLMConfig,
     LLMProvider,
+    PROMPT_DIGEST,
     create_llm_provider
 )
+from ospac.utils.jsonio import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
 
+# Stands in for the analyzed license's own ID in compatibility templates
+_THIS_LICENSE = object()
+
+# Default compatibility rules per license category; rendered by _render_compat_template
+_COMPAT_TEMPLATES: Mapping[str, Dict[str, Any]] = MappingProxyType({
+    "permissive": {
+        "static_linking": {
+            "compatible_with": ["category:any"],
+            "incompatible_with": [],
+            "requires_review": []
+        },
+        "dynamic_linking": {
+            "compatible_with": ["category:any"],
+            "incompatible_with": [],
+            "requires_review": []
+        },
+        "distribution": {
+            "can_distribute_with": ["category:any"],
+            "cannot_distribute_with": [],
+            "special_requirements": ["Include license and copyright notice"]
+        },
+        "contamination_effect": "none",
+        "notes": "Permissive license with minimal restrictions"
+    },
+    "copyleft_strong": {
+        "static_linking": {
+            "compatible_with": [_THIS_LICENSE, "category:copyleft_strong"],
+            "incompatible_with": ["category:permissive", "category:proprietary"],
+            "requires_review": ["category:copyleft_weak"]
+        },
+        "dynamic_linking": {
+            "compatible_with": ["category:any"],
+            "incompatible_with": [],
+            "requires_review": ["category:proprietary"]
+        },
+        "distribution": {
+            "can_distribute_with": [_THIS_LICENSE],
+            "cannot_distribute_with": ["category:proprietary"],
+            "special_requirements": ["Source code must be provided", "Same license required"]
+        },
+        "contamination_effect": "full",
+        "notes": "Strong copyleft with viral effect"
+    },
+    "copyleft_weak": {
+        "static_linking": {
+            "compatible_with": ["category:permissive", _THIS_LICENSE],
+            "incompatible_with": [],
+            "requires_review": ["category:copyleft_strong"]
+        },
+        "dynamic_linking": {
+            "compatible_with": ["category:any"],
+            "incompatible_with": [],
+            "requires_review": []
+        },
+        "distribution": {
+            "can_distribute_with": ["category:any"],
+            "cannot_distribute_with": [],
+            "special_requirements": ["Allow relinking", "Provide LGPL source"]
+        },
+        "contamination_effect": "module",
+        "notes": "Weak copyleft affecting only the library itself"
+    },
+    "default": {
+        "static_linking": {
+            "compatible_with": ["category:any"],
+            "incompatible_with": [],
+            "requires_review": []
+        },
+        "dynamic_linking": {
+            "compatible_with": ["category:any"],
+            "incompatible_with": [],
+            "requires_review": []
+        },
+        "distribution": {
+            "can_distribute_with": ["category:any"],
+            "cannot_distribute_with": [],
+            "special_requirements": []
+        },
+        "contamination_effect": "none",
+        "notes": "Default compatibility rules"
+    },
+})
+
+
+def _render_compat_template(template: Dict[str, Any], license_id: str) -> Dict[str, Any]:
+    """Copy a compatibility template, filling in the license's own ID."""
+    return {
+        key: {
+            rule: [license_id if item is _THIS_LICENSE else item for item in items]
+            for rule, items in value.items()
+        } if isinstance(value, dict) else value
+        for key, value in template.items()
+    }
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts to the LLM backend (additive increase,
+    multiplicative decrease).
+
+    The limit starts at max_concurrent, shrinks by half whenever a request
+    fails and grows back by a fraction of a slot per success, so it settles
+    on what the server can actually serve in parallel.
+    """
+
+    def __init__(self, max_concurrent: int, increase: float = 0.25,
+                 decrease: float = 0.5, max_backoff: float = 8.0):
+        self.max_concurrent = max_concurrent
+        self.limit = float(max_concurrent)
+        self.increase = increase
+        self.decrease = decrease
+        self.max_backoff = max_backoff
+        self.active = 0
+        self.failures = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def record_success(self) -> None:
+        """Grow the limit after a request the backend served."""
+        self.limit = min(self.limit + self.increase, float(self.max_concurrent))
+        self.failures = 0
+
+    async def record_failure(self) -> None:
+        """Shrink the limit and wait a jittered, exponentially growing delay."""
+        self.limit = max(1.0, self.limit * self.decrease)
+        self.failures += 1
+        await asyncio.sleep(random.uniform(0, min(2 ** self.failures, self.max_backoff)))
+
+
 class LicenseAnalyzer:
     """
     Analyze licenses using configurable LLM providers.
     Supports OpenAI, Anthropic Claude, and local Ollama.
     """
 
-    def __init__(self, provider: str = "ollama", model: str = None, api_key: str = None, **kwargs):
+    def __init__(self, provider: str = "ollama", model: str = None, api_key: str = None,
+                 cache_dir: Optional[Path] = None, **kwargs):
         """
         Initialize the license analyzer with specified provider.
 
@@ -32,9 +181,11 @@ class LicenseAnalyzer:
             provider: LLM provider ("openai", "claude", "ollama")
             model: Model name (auto-selected if not provided)
             api_key: API key for cloud providers (or from environment)
+            cache_dir: Directory for cached LLM results
             **kwargs: Additional provider-specific configuration
         """
         self.provider_name = provider.lower()
+        self.cache_dir = cache_dir or Path.home() / ".cache" / "ospac" / "llm"
 
         # Auto-select models if not provided
         if not model:
@@ -100,7 +251,58 @@ class LicenseAnalyzer:
             logger.warning(f"LLM provider not available, returning fallback for {license_id}")
             return self._get_fallback_analysis(license_id)
 
-        return await self.llm_provider.analyze_license(license_id, license_text)
+        cache_key = ("analyze", license_id, self.llm_provider._truncate_license_text(license_text))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        analysis = await self.llm_provider.analyze_license(license_id, license_text)
+        if analysis != self.llm_provider._get_fallback_analysis(license_id):
+            self._cache_put(cache_key, analysis)
+        return analysis
+
+    async def aclose(self) -> None:
+        """Close the LLM provider's client and its pooled connections."""
+        if self.llm_provider:
+            await self.llm_provider.aclose()
+
+    def _cache_path(self, key: tuple) -> Path:
+        """Get the cache file for a request, keyed by provider, model, prompts and inputs."""
+        digest = hashlib.blake2b(digest_size=16)
+        parts = (self.provider_name, self.config.model, PROMPT_DIGEST, self.config.max_input_tokens)
+        for part in parts + key:
+            digest.update(str(part).encode("utf-8") + b"\x00")
+        return self.cache_dir / f"{digest.hexdigest()}.json"
+
+    def _cache_get(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached LLM result, or None on a miss.
+
+        Hits are served even while the LLM is unavailable, so offline reruns
+        reuse earlier results instead of falling back to heuristics.
+        """
+        cache_file = self._cache_path(key)
+        if not cache_file.exists():
+            return None
+        try:
+            return json_loads(cache_file.read_bytes())
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable LLM cache entry {cache_file}: {e}")
+            return None
+
+    def _cache_put(self, key: tuple, result: Dict[str, Any]) -> None:
+        """Store an LLM result; results produced while the LLM is unavailable are not cached."""
+        if not getattr(self.llm_provider, "available", False):
+            return
+
+        cache_file = self._cache_path(key)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(".tmp")
+            tmp_file.write_bytes(json_dumps(result))
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            logger.warning(f"Failed to write LLM cache entry {cache_file}: {e}")
 
     def _get_fallback_analysis(self, license_id: str) -> Dict[str, Any]:
         """
@@ -112,93 +314,7 @@ class LicenseAnalyzer:
         Returns:
             Basic analysis results
         """
-        # Default analysis structure
-        analysis = {
-            "license_id": license_id,
-            "category": "permissive",
-            "permissions": {
-                "commercial_use": True,
-                "distribution": True,
-                "modification": True,
-                "patent_grant": False,
-                "private_use": True
-            },
-            "conditions": {
-                "disclose_source": False,
-                "include_license": True,
-                "include_copyright": True,
-                "include_notice": False,
-                "state_changes": False,
-                "same_license": False,
-                "network_use_disclosure": False
-            },
-            "limitations": {
-                "liability": False,
-                "warranty": False,
-                "trademark_use": False
-            },
-            "compatibility": {
-                "can_combine_with_permissive": True,
-                "can_combine_with_weak_copyleft": True,
-                "can_combine_with_strong_copyleft": False,
-                "static_linking_restrictions": "none",
-                "dynamic_linking_restrictions": "none"
-            },
-            "obligations": ["Include license text", "Include copyright notice"],
-            "key_requirements": ["Attribution required"]
-        }
-
-        # Customize based on known patterns
-        if "GPL" in license_id:
-            analysis["category"] = "copyleft_strong"
-            analysis["conditions"]["disclose_source"] = True
-            analysis["conditions"]["same_license"] = True
-            analysis["compatibility"]["can_combine_with_strong_copyleft"] = True
-            analysis["compatibility"]["can_combine_with_permissive"] = False
-            analysis["compatibility"]["static_linking_restrictions"] = "strong"
-            analysis["obligations"] = [
-                "Disclose source code",
-                "Include license text",
-                "State changes",
-                "Use same license for derivatives"
-            ]
-
-        elif "LGPL" in license_id:
-            analysis["category"] = "copyleft_weak"
-            analysis["conditions"]["disclose_source"] = True
-            analysis["compatibility"]["static_linking_restrictions"] = "weak"
-            analysis["obligations"] = [
-                "Disclose source of LGPL components",
-                "Allow relinking",
-                "Include license text"
-            ]
-
-        elif "AGPL" in license_id:
-            analysis["category"] = "copyleft_strong"
-            analysis["conditions"]["disclose_source"] = True
-            analysis["conditions"]["same_license"] = True
-            analysis["conditions"]["network_use_disclosure"] = True
-            analysis["compatibility"]["static_linking_restrictions"] = "strong"
-
-        elif "Apache" in license_id:
-            analysis["category"] = "permissive"
-            analysis["permissions"]["patent_grant"] = True
-            analysis["conditions"]["include_notice"] = True
-            analysis["conditions"]["state_changes"] = True
-            analysis["conditions"]["disclose_source"] = False
-            analysis["conditions"]["same_license"] = False
-
-        elif "MIT" in license_id or "BSD" in license_id or "ISC" in license_id:
-            analysis["category"] = "permissive"
-            analysis["permissions"]["patent_grant"] = False
-
-        elif "CC0" in license_id or "Unlicense" in license_id:
-            analysis["category"] = "public_domain"
-            analysis["conditions"]["include_license"] = False
-            analysis["conditions"]["include_copyright"] = False
-            analysis["obligations"] = []
-
-        return analysis
+        return _fallback_analysis(license_id)
 
     async def extract_compatibility_rules(self, license_id: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -214,128 +330,116 @@ class LicenseAnalyzer:
         if not self.llm_provider:
             return self._get_default_compatibility_rules(license_id, analysis)
 
-        return await self.llm_provider.extract_compatibility_rules(license_id, analysis)
+        cache_key = ("compat", license_id, analysis.get("category", "unknown"))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        rules = await self.llm_provider.extract_compatibility_rules(license_id, analysis)
+        if rules not in (self.llm_provider._get_default_compatibility_rules(license_id, analysis),
+                         self.llm_provider._get_fallback_analysis(license_id)):
+            self._cache_put(cache_key, rules)
+        return rules
 
     def _get_default_compatibility_rules(self, license_id: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
         """Get default compatibility rules based on license category."""
         category = analysis.get("category", "permissive")
+        template = _COMPAT_TEMPLATES.get(category, _COMPAT_TEMPLATES["default"])
+        return _render_compat_template(template, license_id)
 
-        if category == "permissive":
-            return {
-                "static_linking": {
-                    "compatible_with": ["category:any"],
-                    "incompatible_with": [],
-                    "requires_review": []
-                },
-                "dynamic_linking": {
-                    "compatible_with": ["category:any"],
-                    "incompatible_with": [],
-                    "requires_review": []
-                },
-                "distribution": {
-                    "can_distribute_with": ["category:any"],
-                    "cannot_distribute_with": [],
-                    "special_requirements": ["Include license and copyright notice"]
-                },
-                "contamination_effect": "none",
-                "notes": "Permissive license with minimal restrictions"
-            }
-
-        elif category == "copyleft_strong":
-            return {
-                "static_linking": {
-                    "compatible_with": [license_id, "category:copyleft_strong"],
-                    "incompatible_with": ["category:permissive", "category:proprietary"],
-                    "requires_review": ["category:copyleft_weak"]
-                },
-                "dynamic_linking": {
-                    "compatible_with": ["category:any"],
-                    "incompatible_with": [],
-                    "requires_review": ["category:proprietary"]
-                },
-                "distribution": {
-                    "can_distribute_with": [license_id],
-                    "cannot_distribute_with": ["category:proprietary"],
-                    "special_requirements": ["Source code must be provided", "Same license required"]
-                },
-                "contamination_effect": "full",
-                "notes": "Strong copyleft with viral effect"
-            }
-
-        elif category == "copyleft_weak":
-            return {
-                "static_linking": {
-                    "compatible_with": ["category:permissive", license_id],
-                    "incompatible_with": [],
-                    "requires_review": ["category:copyleft_strong"]
-                },
-                "dynamic_linking": {
-                    "compatible_with": ["category:any"],
-                    "incompatible_with": [],
-                    "requires_review": []
-                },
-                "distribution": {
-                    "can_distribute_with": ["category:any"],
-                    "cannot_distribute_with": [],
-                    "special_requirements": ["Allow relinking", "Provide LGPL source"]
-                },
-                "contamination_effect": "module",
-                "notes": "Weak copyleft affecting only the library itself"
-            }
-
-        else:
-            return {
-                "static_linking": {
-                    "compatible_with": ["category:any"],
-                    "incompatible_with": [],
-                    "requires_review": []
-                },
-                "dynamic_linking": {
-                    "compatible_with": ["category:any"],
-                    "incompatible_with": [],
-                    "requires_review": []
-                },
-                "distribution": {
-                    "can_distribute_with": ["category:any"],
-                    "cannot_distribute_with": [],
-                    "special_requirements": []
-                },
-                "contamination_effect": "none",
-                "notes": "Default compatibility rules"
-            }
-
-    async def batch_analyze(self, licenses: List[Dict[str, Any]], max_concurrent: int = 5) -> List[Dict[str, Any]]:
+    async def batch_analyze(self, licenses: List[Dict[str, Any]],
+                            max_concurrent: int = 5) -> AsyncIterator[Dict[str, Any]]:
         """
-        Analyze multiple licenses concurrently.
+        Analyze multiple licenses concurrently, yielding each result as it completes.
+
+        Licenses with identical texts are analyzed once; compatibility rules
+        are still extracted per license.
+
+        Every LLM request (analysis or compatibility rules) holds its own
+        limiter slot, so at most max_concurrent requests are in flight even
+        though a license's two requests are issued together.
 
         Args:
             licenses: List of license data with id and text
-            max_concurrent: Maximum concurrent analyses
+            max_concurrent: Maximum concurrent LLM requests; lowered automatically
+                while the LLM backend is failing
 
-        Returns:
-            List of analysis results
+        Yields:
+            Analysis results, in completion order
         """
-        results = []
-        semaphore = asyncio.Semaphore(max_concurrent)
-
-        async def analyze_with_semaphore(license_data):
-            async with semaphore:
-                license_id = license_data.get("id")
-                license_text = license_data.get("text", "")
-
-                logger.info(f"Analyzing {license_id}")
-
-                # Basic analysis
+        limiter = AdaptiveLimiter(max_concurrent)
+        llm_available = getattr(self.llm_provider, "available", False)
+        # Licenses with identical texts share a single analysis, keyed by text digest
+        shared_analyses: Dict[bytes, asyncio.Future] = {}
+
+        async def record_outcome(failed: bool):
+            # Providers turn errors into fallback results; treat that as the
+            # backend being overloaded and back off while holding the slot
+            if failed:
+                await limiter.record_failure()
+            else:
+                limiter.record_success()
+
+        async def limited_analysis(license_id, license_text):
+            async with limiter:
                 analysis = await self.analyze_license(license_id, license_text)
-
-                # Extract compatibility rules
-                compatibility = await self.extract_compatibility_rules(license_id, analysis)
-                analysis["compatibility_rules"] = compatibility
-
+                if llm_available:
+                    await record_outcome(analysis == self.llm_provider._get_fallback_analysis(license_id))
                 return analysis
 
-        # Process all licenses
-        tasks = [analyze_with_semaphore(lic) for lic in licenses]
-        results = await asyncio.gather(*tasks)
+        async def limited_compatibility(license_id, analysis):
+            async with limiter:
+                rules = await self.extract_compatibility_rules(license_id, analysis)
+                if llm_available:
+                    await record_outcome(rules in (
+                        self.llm_provider._get_default_compatibility_rules(license_id, analysis),
+                        self.llm_provider._get_fallback_analysis(license_id)
+                    ))
+                return rules
+
+        async def analyze_one(license_data):
+            license_id = license_data.get("id")
+            license_text = license_data.get("text", "")
+
+            text_key = None
+            pending = None
+            if license_text:
+                text_key = hashlib.blake2b(license_text.encode("utf-8"), digest_size=16).digest()
+                pending = shared_analyses.get(text_key)
+            is_duplicate = pending is not None
+            if pending is None:
+                logger.info(f"Analyzing {license_id}")
+                pending = asyncio.ensure_future(limited_analysis(license_id, license_text))
+                if text_key is not None:
+                    shared_analyses[text_key] = pending
+            else:
+                logger.info(f"Reusing analysis of an identical text for {license_id}")
+
+            # The compatibility prompt only needs the category, which the
+            # fallback table nearly always predicts, so both requests run at once
+            tentative = {"category": _fallback_category(license_id)}
+            analysis, compatibility = await asyncio.gather(
+                pending,
+                limited_compatibility(license_id, tentative)
+            )
+
+            if is_duplicate:
+                analysis = copy.deepcopy(analysis)
+                analysis["license_id"] = license_id
+
+            # Redo the compatibility rules if the analysis disagrees on the category
+            if analysis.get("category") != tentative["category"]:
+                compatibility = await limited_compatibility(license_id, analysis)
+            analysis["compatibility_rules"] = compatibility
+
+            return analysis
 
-        return results
\ No newline at end of file
+        # Process all licenses
+        tasks = [asyncio.ensure_future(analyze_one(lic)) for lic in licenses]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # Stop outstanding analyses if the caller stops iterating early
+            for task in tasks:
+                task.cancel()
\ No newline at end of file
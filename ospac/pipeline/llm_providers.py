@@ -3,47 +3,210 @@ LLM provider implementations for OSPAC license analysis.
 Supports OpenAI, Anthropic Claude, and local Ollama.
 """
 
-import json
+import copy
+import hashlib
 import logging
+import re
 import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Mapping, Optional
 from dataclasses import dataclass
+from types import MappingProxyType
+from functools import lru_cache
 
-logger = logging.getLogger(__name__)
-
-
-@dataclass
-class LLMConfig:
-    """Configuration for LLM providers."""
-    provider: str  # "openai", "claude", "ollama"
-    model: str
-    api_key: Optional[str] = None
-    base_url: Optional[str] = None
-    max_tokens: int = 4000
-    temperature: float = 0.1
-
+from ospac.utils.jsonio import json_loads
 
-class LLMProvider(ABC):
-    """Abstract base class for LLM providers."""
+logger = logging.getLogger(__name__)
 
-    def __init__(self, config: LLMConfig):
-        self.config = config
-        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
-    @abstractmethod
-    async def analyze_license(self, license_id: str, license_text: str) -> Dict[str, Any]:
-        """Analyze a license using the LLM provider."""
-        pass
+# Characters that can change the scanner state; everything else is skipped
+_JSON_STRUCTURAL_CHARS = re.compile(r'[{}"\\]')
+
+
+class _JSONObjectScanner:
+    """
+    Incrementally track brace depth to find where the first JSON object ends.
+
+    Braces inside JSON strings are ignored, as is any text before the
+    opening brace. Offsets are counted across everything fed so far.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped_at = -1
+        self.offset = 0
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+
+    def feed(self, text: str) -> bool:
+        """Consume more text; returns True once the first top-level object has closed."""
+        for match in _JSON_STRUCTURAL_CHARS.finditer(text):
+            position = self.offset + match.start()
+            char = match.group()
+            if self.in_string:
+                if position == self.escaped_at:
+                    continue
+                if char == "\\":
+                    self.escaped_at = position + 1
+                elif char == '"':
+                    self.in_string = False
+            elif char == "{":
+                if self.start is None:
+                    self.start = position
+                self.depth += 1
+            elif self.start is None:
+                continue
+            elif char == '"':
+                self.in_string = True
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = position + 1
+                    self.offset += len(text)
+                    return True
+        self.offset += len(text)
+        return False
+
+
+def _extract_top_json(text: str) -> Optional[str]:
+    """Return the first complete top-level JSON object in text, or None."""
+    scanner = _JSONObjectScanner()
+    if scanner.feed(text):
+        return text[scanner.start:scanner.end]
+    return None
+
+
+def _build_fallback_templates() -> Dict[str, Dict[str, Any]]:
+    """Build the fallback analysis for each known license family once, at import time."""
+    # Default analysis structure
+    default = {
+        "license_id": None,
+        "category": "permissive",
+        "permissions": {
+            "commercial_use": True,
+            "distribution": True,
+            "modification": True,
+            "patent_grant": False,
+            "private_use": True
+        },
+        "conditions": {
+            "disclose_source": False,
+            "include_license": True,
+            "include_copyright": True,
+            "include_notice": False,
+            "state_changes": False,
+            "same_license": False,
+            "network_use_disclosure": False
+        },
+        "limitations": {
+            "liability": False,
+            "warranty": False,
+            "trademark_use": False
+        },
+        "compatibility": {
+            "can_combine_with_permissive": True,
+            "can_combine_with_weak_copyleft": True,
+            "can_combine_with_strong_copyleft": False,
+            "static_linking_restrictions": "none",
+            "dynamic_linking_restrictions": "none"
+        },
+        "obligations": ["Include license text", "Include copyright notice"],
+        "key_requirements": ["Attribution required"]
+    }
+
+    gpl = copy.deepcopy(default)
+    gpl["category"] = "copyleft_strong"
+    gpl["conditions"]["disclose_source"] = True
+    gpl["conditions"]["same_license"] = True
+    gpl["compatibility"]["can_combine_with_strong_copyleft"] = True
+    gpl["compatibility"]["can_combine_with_permissive"] = False
+    gpl["compatibility"]["static_linking_restrictions"] = "strong"
+    gpl["obligations"] = [
+        "Disclose source code",
+        "Include license text",
+        "State changes",
+        "Use same license for derivatives"
+    ]
 
-    @abstractmethod
-    async def extract_compatibility_rules(self, license_id: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
-        """Extract compatibility rules for a license."""
-        pass
+    lgpl = copy.deepcopy(default)
+    lgpl["category"] = "copyleft_weak"
+    lgpl["conditions"]["disclose_source"] = True
+    lgpl["compatibility"]["static_linking_restrictions"] = "weak"
+    lgpl["obligations"] = [
+        "Disclose source of LGPL components",
+        "Allow relinking",
+        "Include license text"
+    ]
 
-    def _get_system_prompt(self) -> str:
-        """Get the system prompt for license analysis."""
-        return """You are an expert in software licensing and open source compliance.
+    agpl = copy.deepcopy(default)
+    agpl["category"] = "copyleft_strong"
+    agpl["conditions"]["disclose_source"] = True
+    agpl["conditions"]["same_license"] = True
+    agpl["conditions"]["network_use_disclosure"] = True
+    agpl["compatibility"]["static_linking_restrictions"] = "strong"
+
+    apache = copy.deepcopy(default)
+    apache["permissions"]["patent_grant"] = True
+    apache["conditions"]["include_notice"] = True
+    apache["conditions"]["state_changes"] = True
+
+    public_domain = copy.deepcopy(default)
+    public_domain["category"] = "public_domain"
+    public_domain["conditions"]["include_license"] = False
+    public_domain["conditions"]["include_copyright"] = False
+    public_domain["obligations"] = []
+
+    return {
+        "default": default,
+        "gpl": gpl,
+        "lgpl": lgpl,
+        "agpl": agpl,
+        "apache": apache,
+        "permissive": default,
+        "public_domain": public_domain
+    }
+
+
+_FALLBACK_TEMPLATES: Mapping[str, Dict[str, Any]] = MappingProxyType(_build_fallback_templates())
+
+# License family for each marker substring; longer markers come first in the
+# alternation so "LGPL" and "AGPL" are not read as plain "GPL"
+_FALLBACK_FAMILIES = {
+    "AGPL": "agpl",
+    "LGPL": "lgpl",
+    "GPL": "gpl",
+    "Apache": "apache",
+    "MIT": "permissive",
+    "BSD": "permissive",
+    "ISC": "permissive",
+    "CC0": "public_domain",
+    "Unlicense": "public_domain",
+}
+_FALLBACK_PATTERN = re.compile("|".join(_FALLBACK_FAMILIES))
+
+
+@lru_cache(maxsize=1024)
+def _fallback_variant(license_id: str) -> str:
+    """Map a license ID to the name of its fallback analysis template."""
+    match = _FALLBACK_PATTERN.search(license_id)
+    return _FALLBACK_FAMILIES[match.group()] if match else "default"
+
+
+def _fallback_analysis(license_id: str) -> Dict[str, Any]:
+    """Get a fresh copy of the fallback analysis for a license ID."""
+    analysis = copy.deepcopy(_FALLBACK_TEMPLATES[_fallback_variant(license_id)])
+    analysis["license_id"] = license_id
+    return analysis
+
+
+def _fallback_category(license_id: str) -> str:
+    """Get the category the fallback analysis assigns to a license ID."""
+    return _FALLBACK_TEMPLATES[_fallback_variant(license_id)]["category"]
+
+
+# Prompt templates, rendered with str.format_map; literal braces are doubled
+_SYSTEM_PROMPT = """You are an expert in software licensing and open source compliance.
 Your task is to analyze software licenses and provide detailed, accurate information about:
 - License obligations and requirements
 - Compatibility with other licenses
@@ -53,13 +216,11 @@ Your task is to analyze software licenses and provide detailed, accurate informa
 Always provide information in structured JSON format.
 Be precise and accurate - licensing compliance is critical."""
 
-    def _get_analysis_prompt(self, license_id: str, license_text: str) -> str:
-        """Get the analysis prompt for a specific license."""
-        return f"""Analyze the following license and provide detailed information in JSON format.
+_ANALYSIS_PROMPT = """Analyze the following license and provide detailed information in JSON format.
 
 License ID: {license_id}
-License Text (first 3000 chars):
-{license_text[:3000]}
+License Text (truncated):
+{license_text}
 
 Provide a JSON response with the following structure:
 {{
@@ -101,9 +262,7 @@ Provide a JSON response with the following structure:
     ]
 }}"""
 
-    def _get_compatibility_prompt(self, license_id: str, analysis: Dict[str, Any]) -> str:
-        """Get the compatibility rules prompt."""
-        return f"""Based on the {license_id} license with category {analysis.get('category', 'unknown')},
+_COMPATIBILITY_PROMPT = """Based on the {license_id} license with category {category},
 provide detailed compatibility rules in JSON format:
 
 {{
@@ -126,79 +285,128 @@ provide detailed compatibility rules in JSON format:
     "notes": "Additional compatibility notes"
 }}"""
 
+# Identifies the prompt wording, so cached LLM results are not reused across prompt changes
+PROMPT_DIGEST = hashlib.blake2b(
+    "\x00".join((_SYSTEM_PROMPT, _ANALYSIS_PROMPT, _COMPATIBILITY_PROMPT)).encode("utf-8"),
+    digest_size=8
+).hexdigest()
+
+
+# Character cap for license texts when no tokenizer is installed
+_MAX_INPUT_CHARS = 3000
+
+
+@lru_cache(maxsize=1)
+def _get_tokenizer():
+    """Load the tiktoken encoding used to budget prompt tokens, or None if unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # Not installed, or the encoding could not be loaded
+        return None
+
+
+def _truncate_license_text(license_text: str, max_tokens: int) -> str:
+    """Cut a license text to at most max_tokens tokens, or a fixed number of characters."""
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return license_text[:_MAX_INPUT_CHARS]
+    return _truncate_tokens(tokenizer, license_text, max_tokens)
+
+
+@lru_cache(maxsize=256)
+def _truncate_tokens(tokenizer, license_text: str, max_tokens: int) -> str:
+    """Cut a license text to max_tokens tokens; cached per tokenizer, text and budget."""
+    tokens = tokenizer.encode(license_text)
+    if len(tokens) <= max_tokens:
+        return license_text
+    return tokenizer.decode(tokens[:max_tokens])
+
+
+@dataclass
+class LLMConfig:
+    """Configuration for LLM providers."""
+    provider: str  # "openai", "claude", "ollama"
+    model: str
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+    max_tokens: int = 4000
+    temperature: float = 0.1
+    max_input_tokens: int = 1024
+    max_connections: int = 32
+
+
+class LLMProvider(ABC):
+    """Abstract base class for LLM providers."""
+
+    def __init__(self, config: LLMConfig):
+        self.config = config
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+    @abstractmethod
+    async def analyze_license(self, license_id: str, license_text: str) -> Dict[str, Any]:
+        """Analyze a license using the LLM provider."""
+        pass
+
+    async def aclose(self) -> None:
+        """Close the provider's API client and its pooled connections."""
+        client = getattr(self, "client", None)
+        if client is not None and hasattr(client, "close"):
+            await client.close()
+
+    @abstractmethod
+    async def extract_compatibility_rules(self, license_id: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract compatibility rules for a license."""
+        pass
+
+    def _get_system_prompt(self) -> str:
+        """Get the system prompt for license analysis."""
+        return _SYSTEM_PROMPT
+
+    def _get_analysis_prompt(self, license_id: str, license_text: str) -> str:
+        """Get the analysis prompt for a specific license."""
+        return _ANALYSIS_PROMPT.format_map({
+            "license_id": license_id,
+            "license_text": self._truncate_license_text(license_text)
+        })
+
+    def _truncate_license_text(self, license_text: str) -> str:
+        """Get the part of a license text that is sent to the model."""
+        return _truncate_license_text(license_text, self.config.max_input_tokens)
+
+    def _get_compatibility_prompt(self, license_id: str, analysis: Dict[str, Any]) -> str:
+        """Get the compatibility rules prompt."""
+        return _COMPATIBILITY_PROMPT.format_map({
+            "license_id": license_id,
+            "category": analysis.get("category", "unknown")
+        })
+
     def _parse_json_response(self, response_text: str, license_id: str) -> Dict[str, Any]:
         """Parse JSON from LLM response."""
         try:
-            # Find JSON in response
-            json_start = response_text.find("{")
-            json_end = response_text.rfind("}") + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = response_text[json_start:json_end]
-                return json.loads(json_str)
+            # Providers request JSON output, so the response is usually a bare object
+            parsed = json_loads(response_text)
+            if isinstance(parsed, dict):
+                return parsed
+        except ValueError:
+            pass
+
+        try:
+            # Otherwise find the JSON object in the surrounding text
+            json_str = _extract_top_json(response_text)
+            if json_str is not None:
+                return json_loads(json_str)
             else:
                 self.logger.warning(f"Could not extract JSON from LLM response for {license_id}")
                 return self._get_fallback_analysis(license_id)
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             self.logger.error(f"Failed to parse LLM response for {license_id}: {e}")
             self.logger.debug(f"Response content: {response_text[:500]}")
             return self._get_fallback_analysis(license_id)
 
     def _get_fallback_analysis(self, license_id: str) -> Dict[str, Any]:
         """Get fallback analysis for when LLM fails."""
-        analysis = {
-            "license_id": license_id,
-            "category": "permissive",
-            "permissions": {
-                "commercial_use": True,
-                "distribution": True,
-                "modification": True,
-                "patent_grant": False,
-                "private_use": True
-            },
-            "conditions": {
-                "disclose_source": False,
-                "include_license": True,
-                "include_copyright": True,
-                "include_notice": False,
-                "state_changes": False,
-                "same_license": False,
-                "network_use_disclosure": False
-            },
-            "limitations": {
-                "liability": False,
-                "warranty": False,
-                "trademark_use": False
-            },
-            "compatibility": {
-                "can_combine_with_permissive": True,
-                "can_combine_with_weak_copyleft": True,
-                "can_combine_with_strong_copyleft": False,
-                "static_linking_restrictions": "none",
-                "dynamic_linking_restrictions": "none"
-            },
-            "obligations": ["Include license text", "Include copyright notice"],
-            "key_requirements": ["Attribution required"]
-        }
-
-        # Customize based on known patterns
-        if "GPL" in license_id:
-            analysis["category"] = "copyleft_strong"
-            analysis["conditions"]["disclose_source"] = True
-            analysis["conditions"]["same_license"] = True
-        elif "LGPL" in license_id:
-            analysis["category"] = "copyleft_weak"
-            analysis["conditions"]["disclose_source"] = True
-        elif "AGPL" in license_id:
-            analysis["category"] = "copyleft_strong"
-            analysis["conditions"]["network_use_disclosure"] = True
-        elif "Apache" in license_id:
-            analysis["permissions"]["patent_grant"] = True
-            analysis["conditions"]["disclose_source"] = False
-            analysis["conditions"]["same_license"] = False
-        elif "CC0" in license_id or "Unlicense" in license_id:
-            analysis["category"] = "public_domain"
-
-        return analysis
+        return _fallback_analysis(license_id)
 
 
 class OpenAIProvider(LLMProvider):
@@ -208,7 +416,10 @@ class OpenAIProvider(LLMProvider):
         super().__init__(config)
         try:
             import openai
-            self.client = openai.AsyncOpenAI(api_key=config.api_key)
+            # base_url points at any OpenAI-compatible server (vLLM, llama.cpp);
+            # those usually accept any key, but the client refuses to start without one
+            api_key = config.api_key or ("EMPTY" if config.base_url else None)
+            self.client = openai.AsyncOpenAI(api_key=api_key, base_url=config.base_url)
             self.available = True
         except ImportError:
             self.logger.error("OpenAI package not installed. Install with: pip install openai")
@@ -231,7 +442,8 @@ class OpenAIProvider(LLMProvider):
                     {"role": "user", "content": self._get_analysis_prompt(license_id, license_text)}
                 ],
                 max_tokens=self.config.max_tokens,
-                temperature=self.config.temperature
+                temperature=self.config.temperature,
+                response_format={"type": "json_object"}
             )
 
             response_text = response.choices[0].message.content
@@ -250,10 +462,12 @@ class OpenAIProvider(LLMProvider):
             response = await self.client.chat.completions.create(
                 model=self.config.model,
                 messages=[
+                    {"role": "system", "content": self._get_system_prompt()},
                     {"role": "user", "content": self._get_compatibility_prompt(license_id, analysis)}
                 ],
                 max_tokens=self.config.max_tokens,
-                temperature=self.config.temperature
+                temperature=self.config.temperature,
+                response_format={"type": "json_object"}
             )
 
             response_text = response.choices[0].message.content
@@ -314,6 +528,10 @@ class OpenAIProvider(LLMProvider):
             }
 
 
+# Claude has no JSON mode; starting its reply with "{" skips any prose preamble
+_CLAUDE_JSON_PREFILL = {"role": "assistant", "content": "{"}
+
+
 class ClaudeProvider(LLMProvider):
     """Anthropic Claude LLM provider using Anthropic API."""
 
@@ -343,11 +561,12 @@ class ClaudeProvider(LLMProvider):
                 temperature=self.config.temperature,
                 system=self._get_system_prompt(),
                 messages=[
-                    {"role": "user", "content": self._get_analysis_prompt(license_id, license_text)}
+                    {"role": "user", "content": self._get_analysis_prompt(license_id, license_text)},
+                    _CLAUDE_JSON_PREFILL
                 ]
             )
 
-            response_text = message.content[0].text
+            response_text = "{" + message.content[0].text
             return self._parse_json_response(response_text, license_id)
 
         except Exception as e:
@@ -364,12 +583,14 @@ class ClaudeProvider(LLMProvider):
                 model=self.config.model,
                 max_tokens=self.config.max_tokens,
                 temperature=self.config.temperature,
+                system=self._get_system_prompt(),
                 messages=[
-                    {"role": "user", "content": self._get_compatibility_prompt(license_id, analysis)}
+                    {"role": "user", "content": self._get_compatibility_prompt(license_id, analysis)},
+                    _CLAUDE_JSON_PREFILL
                 ]
             )
 
-            response_text = message.content[0].text
+            response_text = "{" + message.content[0].text
             return self._parse_json_response(response_text, license_id)
 
         except Exception as e:
@@ -389,14 +610,26 @@ class OllamaProvider(LLMProvider):
         try:
             import ollama
             # Test connection
-            models = ollama.list()
+            models = ollama.Client(host=config.base_url).list()
             available_models = [model.model for model in models.models]
 
             if config.model not in available_models:
                 self.logger.warning(f"Model {config.model} not found. Available: {available_models}")
                 self.available = False
             else:
-                self.client = ollama
+                import httpx  # Installed with ollama
+
+                # One async client shared by all requests, so concurrent analyses
+                # reuse kept-alive connections and Ollama can batch them across its
+                # parallel slots; generation itself is not time-limited
+                self.client = ollama.AsyncClient(
+                    host=config.base_url,
+                    timeout=httpx.Timeout(None, connect=5.0),
+                    limits=httpx.Limits(
+                        max_connections=config.max_connections,
+                        max_keepalive_connections=config.max_connections
+                    )
+                )
                 self.available = True
 
         except ImportError:
@@ -413,15 +646,10 @@ class OllamaProvider(LLMProvider):
             return self._get_fallback_analysis(license_id)
 
         try:
-            response = self.client.chat(
-                model=self.config.model,
-                messages=[
-                    {'role': 'system', 'content': self._get_system_prompt()},
-                    {'role': 'user', 'content': self._get_analysis_prompt(license_id, license_text)}
-                ]
-            )
-
-            response_text = response['message']['content']
+            response_text = await self._chat([
+                {'role': 'system', 'content': self._get_system_prompt()},
+                {'role': 'user', 'content': self._get_analysis_prompt(license_id, license_text)}
+            ])
             return self._parse_json_response(response_text, license_id)
 
         except Exception as e:
@@ -434,20 +662,46 @@ class OllamaProvider(LLMProvider):
             return self._get_default_compatibility_rules(license_id, analysis)
 
         try:
-            response = self.client.chat(
-                model=self.config.model,
-                messages=[
-                    {'role': 'user', 'content': self._get_compatibility_prompt(license_id, analysis)}
-                ]
-            )
-
-            response_text = response['message']['content']
+            # Same system prompt as the analysis request, so the server can
+            # reuse its cached prefix instead of prefilling it again
+            response_text = await self._chat([
+                {'role': 'system', 'content': self._get_system_prompt()},
+                {'role': 'user', 'content': self._get_compatibility_prompt(license_id, analysis)}
+            ])
             return self._parse_json_response(response_text, license_id)
 
         except Exception as e:
             self.logger.error(f"Ollama compatibility extraction failed for {license_id}: {e}")
             return self._get_default_compatibility_rules(license_id, analysis)
 
+    async def _chat(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Stream a chat response from Ollama.
+
+        Output is constrained to valid JSON, and generation is cut off as soon
+        as the top-level object is complete; in JSON mode some models keep
+        emitting whitespace after the object otherwise.
+        """
+        scanner = _JSONObjectScanner()
+        parts = []
+        stream = await self.client.chat(
+            model=self.config.model,
+            messages=messages,
+            format="json",
+            stream=True
+        )
+        try:
+            async for chunk in stream:
+                content = chunk['message']['content']
+                parts.append(content)
+                if scanner.feed(content):
+                    break
+        finally:
+            # Closing the stream drops the connection, which stops generation
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+        return "".join(parts)
+
     def _get_default_compatibility_rules(self, license_id: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
         """Get default compatibility rules (same as OpenAI)."""
         return OpenAIProvider._get_default_compatibility_rules(self, license_id, analysis)
@@ -5,6 +5,9 @@ Downloads and processes the official SPDX license list.
 
 import json
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 import requests
@@ -19,6 +22,8 @@ class SPDXProcessor:
 
     SPDX_LICENSE_URL = "https://raw.githubusercontent.com/spdx/license-list-data/main/json/licenses.json"
     SPDX_EXCEPTIONS_URL = "https://raw.githubusercontent.com/spdx/license-list-data/main/json/exceptions.json"
+    TEXT_CACHE_MAX_AGE = 45 * 24 * 60 * 60  # Seconds before a cached license text is refetched
+    TEXT_REQUEST_TIMEOUT = 5  # Seconds to wait for a license details response
 
     def __init__(self, cache_dir: Optional[Path] = None):
         """Initialize SPDX processor."""
@@ -92,8 +97,11 @@ class SPDXProcessor:
         """
         text_cache = self.cache_dir / "texts" / f"{license_id}.txt"
 
+        cached_text = None
         if text_cache.exists():
-            return text_cache.read_text()
+            cached_text = text_cache.read_text()
+            if time.time() - text_cache.stat().st_mtime < self.TEXT_CACHE_MAX_AGE:
+                return cached_text
 
         # Find license details URL
         for license_data in self.licenses:
@@ -101,21 +109,59 @@ class SPDXProcessor:
                 details_url = license_data.get("detailsUrl")
                 if details_url:
                     try:
-                        response = requests.get(details_url)
+                        response = requests.get(details_url, timeout=self.TEXT_REQUEST_TIMEOUT)
                         response.raise_for_status()
                         details = response.json()
 
                         license_text = details.get("licenseText", "")
 
-                        # Cache the text
+                        # Cache the text; write to a temporary file first so an
+                        # interrupted run never leaves a truncated cache entry
                         text_cache.parent.mkdir(parents=True, exist_ok=True)
-                        text_cache.write_text(license_text)
+                        tmp_cache = text_cache.with_suffix(".tmp")
+                        tmp_cache.write_text(license_text)
+                        os.replace(tmp_cache, text_cache)
 
                         return license_text
-                    except Exception as e:
+                    except Exception as e:  # Includes requests.Timeout
                         logger.error(f"Failed to fetch license text for {license_id}: {e}")
 
-        return None
+        # Fall back to an expired cache entry rather than returning nothing
+        return cached_text
+
+    def prefetch_license_texts(self, license_ids: List[str],
+                               max_workers: int = 16) -> Dict[str, Optional[str]]:
+        """
+        Fetch the texts of several licenses concurrently.
+
+        Each fetch is an independent network round trip, so running them in a
+        thread pool bounds total latency by the slowest fetch rather than the sum.
+
+        Args:
+            license_ids: SPDX license identifiers
+            max_workers: Maximum number of concurrent fetches
+
+        Returns:
+            Mapping of license ID to license text (None if not found)
+        """
+        texts: Dict[str, Optional[str]] = {}
+        if not license_ids:
+            return texts
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(license_ids))) as executor:
+            futures = {
+                executor.submit(self.get_license_text, license_id): license_id
+                for license_id in license_ids
+            }
+            for future in as_completed(futures):
+                license_id = futures[future]
+                try:
+                    texts[license_id] = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to fetch license text for {license_id}: {e}")
+                    texts[license_id] = None
+
+        return texts
 
     def extract_basic_info(self, license_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -212,6 +258,9 @@ class SPDXProcessor:
             List of processed license data
         """
         processed = []
+        license_texts = self.prefetch_license_texts(
+            [l.get("licenseId") for l in self.licenses if l.get("licenseId")]
+        )
 
         for license_data in self.licenses:
             license_id = license_data.get("licenseId")
@@ -224,7 +273,7 @@ class SPDXProcessor:
             info = self.extract_basic_info(license_data)
 
             # Get license text
-            license_text = self.get_license_text(license_id)
+            license_text = license_texts.get(license_id)
 
             # Categorize
             info["category"] = self.categorize_license(license_id, license_text)
@@ -2,6 +2,7 @@
 OSPAC utility functions.
 """
 
+from ospac.utils.jsonio import json_dumps, json_loads
 from ospac.utils.validation import validate_license_id, validate_license_path
 
-__all__ = ["validate_license_id", "validate_license_path"]
\ No newline at end of file
+__all__ = ["json_dumps", "json_loads", "validate_license_id", "validate_license_path"]
\ No newline at end of file
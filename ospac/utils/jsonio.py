@@ -0,0 +1,48 @@
+"""
+JSON encoding helpers for OSPAC.
+
+Uses orjson when it is installed (the "fast" extra) and falls back to the
+standard library otherwise.
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # Optional speedup, installed with the "fast" extra
+    orjson = None
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """
+    Parse a JSON document.
+
+    Args:
+        data: JSON text or UTF-8 encoded bytes
+
+    Returns:
+        The decoded value
+
+    Raises:
+        ValueError: If data is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(data: Any, indent: bool = False) -> bytes:
+    """
+    Serialize data to UTF-8 encoded JSON.
+
+    Args:
+        data: Value to serialize
+        indent: Indent nested values by two spaces instead of writing compact JSON
+
+    Returns:
+        The encoded document
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(data, indent=2 if indent else None).encode("utf-8")
@@ -3,17 +3,17 @@ Pytest configuration and fixtures for OSPAC tests.
 """
 
 import pytest
-from pathlib import Path
-import tempfile
 import yaml
 import json
 
+# libyaml's C dumper when PyYAML was built with it
+YAMLDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
 
 @pytest.fixture
-def temp_dir():
+def temp_dir(tmp_path):
     """Create a temporary directory."""
-    with tempfile.TemporaryDirectory() as tmpdir:
-        yield Path(tmpdir)
+    return tmp_path
 
 
 @pytest.fixture
@@ -38,7 +38,7 @@ def sample_policy_yaml(temp_dir):
 
     policy_file = temp_dir / "test_policy.yaml"
     with open(policy_file, "w") as f:
-        yaml.dump(policy, f)
+        yaml.dump(policy, f, Dumper=YAMLDumper)
 
     return policy_file
 
@@ -72,7 +72,7 @@ def sample_license_yaml(temp_dir):
 
     license_file = temp_dir / "MIT.yaml"
     with open(license_file, "w") as f:
-        yaml.dump(license_data, f)
+        yaml.dump(license_data, f, Dumper=YAMLDumper)
 
     return license_file
 
@@ -110,10 +110,10 @@ def policy_directory(temp_dir):
     }
 
     with open(licenses_dir / "MIT.yaml", "w") as f:
-        yaml.dump(mit_license, f)
+        yaml.dump(mit_license, f, Dumper=YAMLDumper)
 
     with open(licenses_dir / "GPL-3.0.yaml", "w") as f:
-        yaml.dump(gpl_license, f)
+        yaml.dump(gpl_license, f, Dumper=YAMLDumper)
 
     # Create compatibility rules
     compat_dir = policies_dir / "compatibility"
@@ -137,14 +137,14 @@ def policy_directory(temp_dir):
     }
 
     with open(compat_dir / "rules.yaml", "w") as f:
-        yaml.dump(compat_rules, f)
+        yaml.dump(compat_rules, f, Dumper=YAMLDumper)
 
     return policies_dir
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_spdx_data():
-    """Mock SPDX license data."""
+    """Mock SPDX license data, shared by the whole session; do not mutate."""
     return {
         "licenses": [
             {
@@ -183,9 +183,9 @@ def mock_spdx_data():
     }
 
 
-@pytest.fixture
-def generated_database(temp_dir):
-    """Create a mock generated database."""
+@pytest.fixture(scope="session")
+def generated_database(tmp_path_factory):
+    """Create a mock generated database, written once per session."""
     database = {
         "version": "1.0",
         "licenses": {
@@ -230,7 +230,7 @@ def generated_database(temp_dir):
         }
     }
 
-    db_file = temp_dir / "ospac_license_database.json"
+    db_file = tmp_path_factory.mktemp("database") / "ospac_license_database.json"
     with open(db_file, "w") as f:
         json.dump(database, f)
 
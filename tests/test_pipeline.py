@@ -2,15 +2,19 @@
 Tests for the data processing pipeline.
 """
 
+import asyncio
 import os
 import pytest
 import json
-from unittest.mock import Mock, patch, MagicMock
+import requests
+import yaml
+from unittest.mock import AsyncMock, Mock, patch, MagicMock
 from pathlib import Path
 
 from ospac.pipeline.spdx_processor import SPDXProcessor
-from ospac.pipeline.llm_analyzer import LicenseAnalyzer
+from ospac.pipeline.llm_analyzer import AdaptiveLimiter, LicenseAnalyzer
 from ospac.pipeline.data_generator import PolicyDataGenerator
+from ospac.pipeline.llm_providers import LLMConfig, OllamaProvider
 
 # Skip LLM tests in CI environment
 skip_llm_tests = pytest.mark.skipif(
@@ -98,6 +102,59 @@ class TestSPDXProcessor:
         assert processor.categorize_license("CC0-1.0") == "public_domain"
         assert processor.categorize_license("Unknown-License") == "permissive"
 
+    def test_prefetch_license_texts(self, temp_dir):
+        """Test fetching several license texts at once."""
+        texts_dir = temp_dir / "texts"
+        texts_dir.mkdir()
+        (texts_dir / "MIT.txt").write_text("MIT text")
+        (texts_dir / "GPL-3.0.txt").write_text("GPL text")
+
+        processor = SPDXProcessor(cache_dir=temp_dir)
+        texts = processor.prefetch_license_texts(["MIT", "GPL-3.0", "Unknown"])
+
+        assert texts == {"MIT": "MIT text", "GPL-3.0": "GPL text", "Unknown": None}
+
+    @patch("requests.get")
+    def test_get_license_text_refreshes_stale_cache(self, mock_get, temp_dir):
+        """Test that expired cached license texts are fetched again."""
+        text_cache = temp_dir / "texts" / "MIT.txt"
+        text_cache.parent.mkdir()
+        text_cache.write_text("Old MIT text")
+        stale = text_cache.stat().st_mtime - SPDXProcessor.TEXT_CACHE_MAX_AGE - 1
+        os.utime(text_cache, (stale, stale))
+
+        mock_response = Mock()
+        mock_response.json.return_value = {"licenseText": "New MIT text"}
+        mock_response.raise_for_status = Mock()
+        mock_get.return_value = mock_response
+
+        processor = SPDXProcessor(cache_dir=temp_dir)
+        processor.licenses = [
+            {"licenseId": "MIT", "detailsUrl": "https://spdx.org/licenses/MIT.json"}
+        ]
+
+        assert processor.get_license_text("MIT") == "New MIT text"
+        assert text_cache.read_text() == "New MIT text"
+        assert not list(text_cache.parent.glob("*.tmp"))
+
+    @patch("requests.get")
+    def test_get_license_text_falls_back_on_timeout(self, mock_get, temp_dir):
+        """Test that a slow details request falls back to the expired cached text."""
+        text_cache = temp_dir / "texts" / "MIT.txt"
+        text_cache.parent.mkdir()
+        text_cache.write_text("Old MIT text")
+        stale = text_cache.stat().st_mtime - SPDXProcessor.TEXT_CACHE_MAX_AGE - 1
+        os.utime(text_cache, (stale, stale))
+        mock_get.side_effect = requests.Timeout()
+
+        processor = SPDXProcessor(cache_dir=temp_dir)
+        processor.licenses = [
+            {"licenseId": "MIT", "detailsUrl": "https://spdx.org/licenses/MIT.json"}
+        ]
+
+        assert processor.get_license_text("MIT") == "Old MIT text"
+        assert mock_get.call_args.kwargs["timeout"] == SPDXProcessor.TEXT_REQUEST_TIMEOUT
+
     def test_save_processed_data(self, temp_dir):
         """Test saving processed data."""
         processor = SPDXProcessor()
@@ -158,6 +215,31 @@ class TestLicenseAnalyzer:
         # Fallback analysis returns basic compatibility info
         assert "compatibility" in analysis
 
+    def test_fallback_analysis_prefers_longest_family(self):
+        """Test that LGPL and AGPL IDs are not treated as plain GPL."""
+        analyzer = LicenseAnalyzer()
+
+        lgpl = analyzer._get_fallback_analysis("LGPL-2.1-only")
+        agpl = analyzer._get_fallback_analysis("AGPL-3.0-only")
+
+        assert lgpl["license_id"] == "LGPL-2.1-only"
+        assert lgpl["category"] == "copyleft_weak"
+        assert agpl["category"] == "copyleft_strong"
+        assert agpl["conditions"]["network_use_disclosure"] is True
+        assert analyzer._get_fallback_analysis("Zlib")["category"] == "permissive"
+
+    def test_default_compatibility_rules_are_fresh_copies(self):
+        """Test that default rules name the license and are safe to mutate."""
+        analyzer = LicenseAnalyzer()
+
+        copyleft = {"category": "copyleft_strong"}
+        rules = analyzer._get_default_compatibility_rules("GPL-3.0", copyleft)
+        rules["distribution"]["can_distribute_with"].append("MIT")
+        again = analyzer._get_default_compatibility_rules("GPL-2.0", copyleft)
+
+        assert rules["static_linking"]["compatible_with"][0] == "GPL-3.0"
+        assert again["distribution"]["can_distribute_with"] == ["GPL-2.0"]
+
     @skip_llm_tests
     @pytest.mark.asyncio
     async def test_extract_compatibility_rules(self):
@@ -183,12 +265,284 @@ class TestLicenseAnalyzer:
             {"id": "GPL-3.0", "text": "GPL text"}
         ]
 
-        results = await analyzer.batch_analyze(licenses, max_concurrent=2)
+        results = [
+            analysis async for analysis in analyzer.batch_analyze(licenses, max_concurrent=2)
+        ]
+
+        assert len(results) == 2
+        assert {analysis["license_id"] for analysis in results} == {"MIT", "GPL-3.0"}
+        assert all("compatibility_rules" in analysis for analysis in results)
+
+    @pytest.mark.asyncio
+    async def test_batch_analyze_reissues_compatibility_on_category_change(self, temp_dir):
+        """Test that compatibility rules follow the analyzed category, not the guess."""
+        analyzer = LicenseAnalyzer(cache_dir=temp_dir)
+        analyzer.analyze_license = AsyncMock(side_effect=[
+            {"license_id": "MIT", "category": "permissive"},
+            {"license_id": "Custom-1.0", "category": "copyleft_strong"}
+        ])
+        analyzer.extract_compatibility_rules = AsyncMock(
+            side_effect=lambda license_id, analysis: {"category": analysis["category"]}
+        )
+
+        results = {
+            analysis["license_id"]: analysis
+            async for analysis in analyzer.batch_analyze([
+                {"id": "MIT", "text": "MIT text"},
+                {"id": "Custom-1.0", "text": "Custom text"}
+            ])
+        }
+
+        assert results["MIT"]["compatibility_rules"] == {"category": "permissive"}
+        assert results["Custom-1.0"]["compatibility_rules"] == {"category": "copyleft_strong"}
+        assert analyzer.extract_compatibility_rules.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_batch_analyze_deduplicates_texts(self, temp_dir):
+        """Test that identical license texts are only analyzed once."""
+        analyzer = LicenseAnalyzer(cache_dir=temp_dir)
+        analyzer.analyze_license = AsyncMock(
+            side_effect=lambda license_id, text: {
+                "license_id": license_id, "category": "permissive"
+            }
+        )
+
+        results = {
+            analysis["license_id"]: analysis
+            async for analysis in analyzer.batch_analyze([
+                {"id": "MIT", "text": "Same text"},
+                {"id": "MIT-0", "text": "Same text"},
+                {"id": "ISC", "text": "Other text"}
+            ])
+        }
+
+        assert set(results) == {"MIT", "MIT-0", "ISC"}
+        assert analyzer.analyze_license.await_count == 2
+        assert results["MIT"] is not results["MIT-0"]
+
+    @pytest.mark.asyncio
+    async def test_batch_analyze_limits_all_llm_requests(self, temp_dir):
+        """Test that analysis and compatibility requests share the concurrency limit."""
+        analyzer = LicenseAnalyzer(cache_dir=temp_dir)
+        in_flight = peak = 0
+
+        async def request(license_id, payload):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return {"license_id": license_id, "category": "permissive"}
+
+        analyzer.analyze_license = AsyncMock(side_effect=request)
+        analyzer.extract_compatibility_rules = AsyncMock(side_effect=request)
+
+        results = [
+            analysis async for analysis in analyzer.batch_analyze([
+                {"id": "MIT", "text": "MIT text"},
+                {"id": "ISC", "text": "ISC text"}
+            ], max_concurrent=1)
+        ]
 
         assert len(results) == 2
-        assert results[0]["license_id"] == "MIT"
-        assert results[1]["license_id"] == "GPL-3.0"
-        assert "compatibility_rules" in results[0]
+        assert peak == 1
+
+    @pytest.mark.asyncio
+    async def test_analyze_license_serves_cache_when_unavailable(self, temp_dir):
+        """Test that cached results are reused offline and keyed by the prompt wording."""
+        analyzer = LicenseAnalyzer(cache_dir=temp_dir)
+        provider = MagicMock(available=True)
+        provider.analyze_license = AsyncMock(
+            return_value={"license_id": "MIT", "category": "permissive"}
+        )
+        provider._get_fallback_analysis.return_value = {}
+        provider._truncate_license_text.side_effect = lambda text: text
+        analyzer.llm_provider = provider
+        await analyzer.analyze_license("MIT", "MIT text")
+
+        provider.available = False
+        provider.analyze_license.return_value = {"license_id": "MIT", "category": "unknown"}
+        offline = await analyzer.analyze_license("MIT", "MIT text")
+        assert offline == {"license_id": "MIT", "category": "permissive"}
+        assert provider.analyze_license.await_count == 1
+
+        with patch("ospac.pipeline.llm_analyzer.PROMPT_DIGEST", "changed"):
+            changed = await analyzer.analyze_license("MIT", "MIT text")
+        assert changed["category"] == "unknown"
+        assert provider.analyze_license.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_adaptive_limiter(self):
+        """Test that the concurrency limit halves on failure and recovers on success."""
+        limiter = AdaptiveLimiter(4, max_backoff=0)
+        await limiter.record_failure()
+        assert limiter.limit == 2
+
+        peak = 0
+
+        async def task():
+            nonlocal peak
+            async with limiter:
+                peak = max(peak, limiter.active)
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*(task() for _ in range(6)))
+        assert peak == 2
+
+        for _ in range(20):
+            limiter.record_success()
+        assert limiter.limit == 4
+
+    @pytest.mark.asyncio
+    async def test_analyze_license_uses_cache(self, temp_dir):
+        """Test that repeated analyses are served from the on-disk cache."""
+        analyzer = LicenseAnalyzer(cache_dir=temp_dir)
+        provider = MagicMock(available=True)
+        provider.analyze_license = AsyncMock(
+            return_value={"license_id": "MIT", "category": "permissive"}
+        )
+        provider._get_fallback_analysis.return_value = {}
+        provider._truncate_license_text.side_effect = lambda text: text
+        analyzer.llm_provider = provider
+
+        first = await analyzer.analyze_license("MIT", "MIT text")
+        second = await analyzer.analyze_license("MIT", "MIT text")
+
+        assert first == second == {"license_id": "MIT", "category": "permissive"}
+        assert provider.analyze_license.await_count == 1
+
+        assert len(list(temp_dir.iterdir())) == 1
+
+        # Fallback results are never cached, even while the provider is available
+        fallback = {"license_id": "GPL-3.0", "category": "copyleft_strong"}
+        provider.analyze_license.return_value = fallback
+        provider._get_fallback_analysis.return_value = fallback
+        await analyzer.analyze_license("GPL-3.0", "GPL text")
+        await analyzer.analyze_license("GPL-3.0", "GPL text")
+        assert provider.analyze_license.await_count == 3
+        assert len(list(temp_dir.iterdir())) == 1
+
+        # Nor are default compatibility rules
+        default_rules = {"contamination_effect": "full"}
+        provider.extract_compatibility_rules = AsyncMock(return_value=default_rules)
+        provider._get_default_compatibility_rules.return_value = default_rules
+        await analyzer.extract_compatibility_rules("GPL-3.0", fallback)
+        await analyzer.extract_compatibility_rules("GPL-3.0", fallback)
+        assert provider.extract_compatibility_rules.await_count == 2
+        assert len(list(temp_dir.iterdir())) == 1
+
+
+class TestOllamaProvider:
+    """Test the OllamaProvider class."""
+
+    def _make_provider(self, chunks):
+        """Create a provider whose client streams the given response chunks."""
+        with patch.dict("sys.modules", {"ollama": None}):
+            provider = OllamaProvider(LLMConfig(provider="ollama", model="llama3:latest"))
+
+        provider.streamed = []
+
+        async def stream():
+            for chunk in chunks:
+                provider.streamed.append(chunk)
+                yield {"message": {"content": chunk}}
+
+        provider.client = Mock()
+        provider.client.chat = AsyncMock(return_value=stream())
+        provider.available = True
+        return provider
+
+    @pytest.mark.asyncio
+    async def test_analyze_license_stops_after_json_object(self):
+        """Test that streaming stops once the JSON object is complete."""
+        provider = self._make_provider([
+            'Here is the analysis: {"license_id": "MIT", ',
+            '"category": "permissive", "notes": "braces } in {strings}"',
+            '} Let me know',
+            ' if you need anything else.'
+        ])
+
+        analysis = await provider.analyze_license("MIT", "MIT text")
+
+        assert analysis["category"] == "permissive"
+        assert analysis["notes"] == "braces } in {strings}"
+        assert len(provider.streamed) == 3
+        assert provider.client.chat.call_args.kwargs["stream"] is True
+        assert provider.client.chat.call_args.kwargs["format"] == "json"
+
+    def test_tokenizer_loaded_on_first_truncation(self):
+        """Test that creating a provider does not load the tokenizer."""
+        with patch(
+            "ospac.pipeline.llm_providers._get_tokenizer", return_value=None
+        ) as get_tokenizer:
+            provider = self._make_provider([])
+            get_tokenizer.assert_not_called()
+
+            provider._truncate_license_text("MIT text")
+        get_tokenizer.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_compatibility_request_shares_system_prompt(self):
+        """Test that compatibility requests start with the same system prompt as analyses."""
+        provider = self._make_provider(['{"contamination_effect": "none"}'])
+
+        rules = await provider.extract_compatibility_rules("MIT", {"category": "permissive"})
+
+        messages = provider.client.chat.call_args.kwargs["messages"]
+        assert rules == {"contamination_effect": "none"}
+        assert messages[0] == {"role": "system", "content": provider._get_system_prompt()}
+        assert messages[1]["role"] == "user"
+
+    @pytest.mark.asyncio
+    async def test_analyzer_aclose_closes_provider_client(self, temp_dir):
+        """Test that closing the analyzer closes the provider's pooled client."""
+        provider = self._make_provider([])
+        provider.client.close = AsyncMock()
+        analyzer = LicenseAnalyzer(cache_dir=temp_dir)
+        analyzer.llm_provider = provider
+
+        await analyzer.aclose()
+
+        provider.client.close.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_fallback_matches_analyzer_fallback(self):
+        """Test that the provider fallback uses the same license families as the analyzer."""
+        provider = self._make_provider([])
+        provider.available = False
+
+        analysis = await provider.analyze_license("LGPL-2.1-only", "LGPL text")
+
+        assert analysis["category"] == "copyleft_weak"
+        assert analysis == LicenseAnalyzer()._get_fallback_analysis("LGPL-2.1-only")
+
+    def test_parse_json_response_ignores_trailing_text(self):
+        """Test that only the first top-level JSON object is parsed."""
+        provider = self._make_provider([])
+
+        analysis = provider._parse_json_response(
+            'Result: {"license_id": "MIT", "notes": "escaped \\" and }"} '
+            'Alternative: {"license_id": "BSD"}',
+            "MIT"
+        )
+
+        assert analysis == {"license_id": "MIT", "notes": 'escaped " and }'}
+
+    def test_analysis_prompt_truncates_license_text(self):
+        """Test that license texts are cut to the token budget, or to 3000 chars without one."""
+        provider = self._make_provider([])
+        provider.config.max_input_tokens = 3
+        license_text = "word " * 1000
+
+        tokenizer = Mock()
+        tokenizer.encode.side_effect = str.split
+        tokenizer.decode.side_effect = " ".join
+        with patch("ospac.pipeline.llm_providers._get_tokenizer", return_value=tokenizer):
+            prompt = provider._get_analysis_prompt("MIT", license_text)
+        assert "License Text (truncated):\nword word word\n" in prompt
+
+        with patch("ospac.pipeline.llm_providers._get_tokenizer", return_value=None):
+            assert provider._truncate_license_text(license_text) == license_text[:3000]
 
 
 class TestPolicyDataGenerator:
@@ -300,4 +654,122 @@ class TestPolicyDataGenerator:
         assert report["missing_category"] == 1
         assert report["missing_obligations"] == 1
         assert report["is_valid"] is False
-        assert len(report["validation_errors"]) > 0
\ No newline at end of file
+        assert len(report["validation_errors"]) > 0
+
+    def test_generate_license_policies(self, temp_dir):
+        """Test writing individual license policy files."""
+        generator = PolicyDataGenerator(output_dir=temp_dir)
+
+        licenses = [
+            {
+                "license_id": "MIT",
+                "name": "MIT License",
+                "category": "permissive",
+                "permissions": {"commercial_use": True},
+                "obligations": ["Include license"],
+                "compatibility_rules": {
+                    "static_linking": {"compatible_with": ["category:any"]}
+                }
+            },
+            {"name": "No identifier"}
+        ]
+
+        generator._generate_license_policies(generator._normalize_licenses(licenses))
+
+        policy_files = list((temp_dir / "licenses" / "spdx").glob("*.yaml"))
+        assert [p.name for p in policy_files] == ["MIT.yaml"]
+        assert not list((temp_dir / "licenses" / "spdx").glob("*.tmp"))
+
+        with open(policy_files[0]) as f:
+            policy = yaml.safe_load(f)
+
+        assert policy["license"]["id"] == "MIT"
+        assert policy["license"]["type"] == "permissive"
+        assert policy["license"]["obligations"] == ["Include license"]
+        compatibility = policy["license"]["compatibility"]
+        assert compatibility["static_linking"]["compatible_with"] == ["category:any"]
+        assert compatibility["dynamic_linking"]["compatible_with"] == []
+
+    def test_generate_compatibility_matrix(self, temp_dir):
+        """Test generating the full compatibility matrix file."""
+        generator = PolicyDataGenerator(output_dir=temp_dir)
+
+        licenses = [
+            {"license_id": "MIT", "category": "permissive"},
+            {"license_id": "Apache-2.0", "category": "permissive"},
+            {"license_id": "GPL-3.0", "category": "copyleft_strong"},
+            {"license_id": "MPL-2.0", "category": "copyleft_weak"}
+        ]
+
+        rows = generator._normalize_licenses(licenses)
+        result = generator._generate_compatibility_matrix(rows, "2024-01-01T00:00:00")
+
+        assert result == {
+            "total_licenses": 4,
+            "path": str(temp_dir / "compatibility_matrix.json")
+        }
+
+        with open(temp_dir / "compatibility_matrix.json") as f:
+            matrix = json.load(f)
+
+        compatibility = matrix["compatibility"]
+        assert matrix["total_licenses"] == 4
+        assert set(compatibility) == {"MIT", "Apache-2.0", "GPL-3.0", "MPL-2.0"}
+        assert compatibility["MIT"]["Apache-2.0"]["static_linking"] == "compatible"
+        assert compatibility["GPL-3.0"]["MIT"]["static_linking"] == "incompatible"
+        assert compatibility["GPL-3.0"]["GPL-3.0"]["distribution"] == "compatible"
+        assert compatibility["MIT"]["MPL-2.0"]["static_linking"] == "review_required"
+        assert matrix["generated"] == "2024-01-01T00:00:00"
+
+    def test_generate_license_policies_skips_unchanged(self, temp_dir):
+        """Test that unchanged policy files are not rewritten."""
+        generator = PolicyDataGenerator(output_dir=temp_dir)
+        policy_file = temp_dir / "licenses" / "spdx" / "MIT.yaml"
+
+        licenses = [{"license_id": "MIT", "category": "permissive"}]
+        generator._generate_license_policies(generator._normalize_licenses(licenses))
+        os.utime(policy_file, (0, 0))
+
+        generator._generate_license_policies(generator._normalize_licenses(licenses))
+        assert policy_file.stat().st_mtime == 0
+
+        licenses[0]["obligations"] = ["Include license"]
+        generator._generate_license_policies(generator._normalize_licenses(licenses))
+        assert policy_file.stat().st_mtime != 0
+        with open(policy_file) as f:
+            assert yaml.safe_load(f)["license"]["obligations"] == ["Include license"]
+
+    def test_generate_license_policies_rewrites_files_changed_elsewhere(self, temp_dir):
+        """Test that the unchanged check compares against the file on disk."""
+        generator = PolicyDataGenerator(output_dir=temp_dir)
+        policy_file = temp_dir / "licenses" / "spdx" / "MIT.yaml"
+        rows = generator._normalize_licenses([{"license_id": "MIT", "category": "permissive"}])
+
+        generator._generate_license_policies(rows)
+        generator._generate_individual_policy({"license_id": "MIT", "category": "copyleft_strong"})
+        generator._generate_license_policies(rows)
+
+        with open(policy_file) as f:
+            assert yaml.safe_load(f)["license"]["type"] == "permissive"
+
+    def test_scan_licenses(self, temp_dir):
+        """Test counting categories and validating in one pass."""
+        generator = PolicyDataGenerator(output_dir=temp_dir)
+
+        licenses = [
+            {
+                "license_id": "MIT",
+                "category": "permissive",
+                "permissions": {"commercial_use": True}
+            },
+            {"license_id": "GPL-3.0", "category": "copyleft_strong", "permissions": {}},
+            {"license_id": "Unknown"}
+        ]
+
+        categories, report = generator._scan_licenses(licenses)
+
+        assert categories == generator._count_categories(licenses)
+        assert categories == {"permissive": 1, "copyleft_strong": 1, "unknown": 1}
+        assert report == generator._validate_generated_data(licenses)
+        assert report["missing_category"] == 1
+        assert report["missing_permissions"] == 2